@@ -1,26 +1,51 @@
 from fastapi import FastAPI, HTTPException, Depends, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, HTMLResponse, ORJSONResponse, RedirectResponse
 from pydantic import BaseModel, Field
 from typing import List, Tuple, Literal
+import hmac
 import os
 import secrets
 import time
 import asyncio
-import httpx
+from contextlib import asynccontextmanager
 from route_generator import generate_custom_route
+from utils import graphhopper_api
 
 GRAPHHOPPER_HOST = os.environ.get("GRAPHHOPPER_HOST", "http://localhost:8989")
 API_KEYS = [k for k in os.environ.get("APP_API_KEYS", "").split(",") if k]
 
+# Key lookup is a single set membership test on HMAC digests rather than a
+# compare_digest loop over every configured key: O(1) per request and the
+# timing no longer depends on how many keys exist. The secret only has to
+# be stable within this process, so it is generated at startup.
+_KEY_HMAC_SECRET = secrets.token_bytes(32)
+_KEY_HASHES = frozenset(
+    hmac.new(_KEY_HMAC_SECRET, k.encode(), "sha256").digest() for k in API_KEYS
+)
+
 RATE_LIMIT_PER_MIN = int(os.environ.get("RATE_LIMIT_PER_MIN", "60"))
 RATE_LIMIT_WINDOW = 60
 MAX_REQUEST_SIZE = int(os.environ.get("MAX_REQUEST_SIZE", str(1024 * 1024)))
 
 PRIVACY_POLICY_PATH = os.path.join(os.getcwd(), "privacy_policy.html")
 
-app = FastAPI(title="Route Generator API", version="1.0", docs_url=None, redoc_url=None)
+# The policy is static — read it once at startup instead of hitting the disk
+# and building a fresh string on every request.
+with open(PRIVACY_POLICY_PATH, "r", encoding="utf-8") as _f:
+    PRIVACY_POLICY_HTML = _f.read()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # All outbound HTTP goes through the shared keep-alive client.
+    await graphhopper_api.aclose_client()
+
+
+# orjson serialises the large coordinate lists in C, several times faster
+# than the stdlib json encoder behind the default JSONResponse.
+app = FastAPI(title="Route Generator API", version="1.0", docs_url=None, redoc_url=None,
+              default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # --- CORS ---
 app.add_middleware(
@@ -34,50 +59,116 @@ app.add_middleware(
 # --- Serve GPX files ---
 gpx_dir = os.path.join(os.getcwd(), "gpx")
 os.makedirs(gpx_dir, exist_ok=True)
-app.mount("/gpx", StaticFiles(directory=gpx_dir), name="gpx")
 
 
-# --- Security / request size ---
-@app.middleware("http")
-async def limit_request_size(request: Request, call_next):
-    cl = request.headers.get("content-length")
-    if cl:
-        try:
-            if int(cl) > MAX_REQUEST_SIZE:
-                return PlainTextResponse("Request too large", status_code=413)
-        except ValueError:
-            pass
-    return await call_next(request)
+@app.get("/gpx/{filename}")
+async def download_gpx(filename: str):
+    # FileResponse lets the server use the sendfile fast path instead of the
+    # user-space buffering StaticFiles does. Only the flat route_*.gpx names
+    # the generator writes are served.
+    if filename != os.path.basename(filename) or filename.startswith(".") or not filename.endswith(".gpx"):
+        raise HTTPException(status_code=404, detail="GPX file not found")
+    path = os.path.join(gpx_dir, filename)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="GPX file not found")
+    return FileResponse(path, media_type="application/gpx+xml", filename=filename)
 
 
+# --- Security / request size ---
+class RequestSizeLimiter:
+    """Raw ASGI guard that rejects oversized bodies.
+
+    Scans the header byte tuples in the scope directly — no Request object,
+    header-dict build, int() parse or try/except on the hot path. Two digit
+    strings of equal length compare correctly byte-wise, so the limit is
+    held as pre-encoded bytes.
+    """
+
+    def __init__(self, app, max_size: int):
+        self.app = app
+        self._max_bytes = str(max_size).encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    if value.isdigit() and (
+                        len(value) > len(self._max_bytes)
+                        or (len(value) == len(self._max_bytes) and value > self._max_bytes)
+                    ):
+                        await send({"type": "http.response.start", "status": 413,
+                                    "headers": [(b"content-type", b"text/plain; charset=utf-8")]})
+                        await send({"type": "http.response.body", "body": b"Request too large"})
+                        return
+                    break
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(RequestSizeLimiter, max_size=MAX_REQUEST_SIZE)
+
+
+# Paths that bypass the privacy-policy redirect; frozenset for O(1) lookup.
+_ALLOWED_PATHS = frozenset({"/probe", "/health", "/generate-route", "/privacy-policy"})
+
+_SECURITY_HEADERS = {
+    "Strict-Transport-Security": "max-age=63072000; includeSubDomains; preload",
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "Referrer-Policy": "no-referrer",
+    "Content-Security-Policy":
+        "default-src 'none'; img-src 'self' data:; connect-src 'self'; style-src 'self';",
+}
+
+
+# One combined middleware instead of separate redirect and header stacks:
+# each @app.middleware("http") is its own ASGI app, so every extra one costs
+# a call_next frame per request.
 @app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    response = await call_next(request)
-    response.headers.setdefault("Strict-Transport-Security", "max-age=63072000; includeSubDomains; preload")
-    response.headers.setdefault("X-Content-Type-Options", "nosniff")
-    response.headers.setdefault("X-Frame-Options", "DENY")
-    response.headers.setdefault("Referrer-Policy", "no-referrer")
-    response.headers.setdefault("Content-Security-Policy",
-                                "default-src 'none'; img-src 'self' data:; connect-src 'self'; style-src 'self';")
+async def redirect_and_secure_headers(request: Request, call_next):
+    # scope["path"] avoids building the full URL object just to read the path.
+    path = request.scope["path"]
+    if not (path.startswith("/gpx/") or path in _ALLOWED_PATHS):
+        response = RedirectResponse(url="/privacy-policy")
+    else:
+        response = await call_next(request)
+
+    for name, value in _SECURITY_HEADERS.items():
+        response.headers.setdefault(name, value)
     return response
 
 
 # --- Rate limiting ---
-_rate_lock = asyncio.Lock()
-_rate_state = {}
+# Token bucket per API key: O(1) per request and two floats of state per key.
+# Per-key locks so different API keys never contend on a shared lock.
+_RATE_REFILL_PER_S = RATE_LIMIT_PER_MIN / RATE_LIMIT_WINDOW
+_RATE_STATE_MAX_KEYS = 10_000
+_rate_state: dict[str, tuple[float, float]] = {}
+_rate_locks: dict[str, asyncio.Lock] = {}
+
+
+def _evict_stale_rate_keys(now: float):
+    # Only evict entries idle for longer than the window; never clear the
+    # whole dict, which would reset active buckets and open a bypass window.
+    cutoff = now - RATE_LIMIT_WINDOW
+    for key in [k for k, (_, last_refill) in _rate_state.items() if last_refill < cutoff]:
+        del _rate_state[key]
+        lock = _rate_locks.get(key)
+        if lock is not None and not lock.locked():
+            del _rate_locks[key]
 
 
 async def _check_rate_limit(api_key: str):
-    now = int(time.time())
-    window_start = now - RATE_LIMIT_WINDOW
-    async with _rate_lock:
-        timestamps = _rate_state.get(api_key, [])
-        timestamps = [t for t in timestamps if t > window_start]
-        if len(timestamps) >= RATE_LIMIT_PER_MIN:
-            _rate_state[api_key] = timestamps
+    now = time.monotonic()
+    if len(_rate_state) > _RATE_STATE_MAX_KEYS:
+        _evict_stale_rate_keys(now)
+    lock = _rate_locks.setdefault(api_key, asyncio.Lock())
+    async with lock:
+        tokens, last_refill = _rate_state.get(api_key, (float(RATE_LIMIT_PER_MIN), now))
+        tokens = min(float(RATE_LIMIT_PER_MIN), tokens + (now - last_refill) * _RATE_REFILL_PER_S)
+        if tokens < 1.0:
+            _rate_state[api_key] = (tokens, now)
             return False
-        timestamps.append(now)
-        _rate_state[api_key] = timestamps
+        _rate_state[api_key] = (tokens - 1.0, now)
         return True
 
 
@@ -110,8 +201,8 @@ async def verify_api_key(x_api_key: str = Header(None)):
         raise HTTPException(status_code=401, detail="No API keys configured on server")
     if not x_api_key:
         raise HTTPException(status_code=401, detail="Missing X-API-Key header")
-    ok = any(secrets.compare_digest(x_api_key, k) for k in API_KEYS)
-    if not ok:
+    digest = hmac.new(_KEY_HMAC_SECRET, x_api_key.encode(), "sha256").digest()
+    if digest not in _KEY_HASHES:
         raise HTTPException(status_code=403, detail="Invalid API key")
     allowed = await _check_rate_limit(x_api_key)
     if not allowed:
@@ -122,9 +213,8 @@ async def verify_api_key(x_api_key: str = Header(None)):
 # --- Endpoints ---
 @app.post("/generate-route", response_model=RouteResponse)
 async def generate_route_endpoint(req: RouteRequest, api_key: str = Depends(verify_api_key)):
-    print("TEST")
     try:
-        result = generate_custom_route(
+        result = await generate_custom_route(
             waypoints=req.waypoints,
             profile=req.profile,
             target_distance_m=req.target_distance_m,
@@ -135,16 +225,11 @@ async def generate_route_endpoint(req: RouteRequest, api_key: str = Depends(veri
         raise HTTPException(status_code=500, detail=f"Route generation failed: {e}")
     if not isinstance(result, dict) or "route" not in result:
         raise HTTPException(status_code=500, detail="Route generator returned invalid result format")
-    return {
-        "route": [(lat, lon, ele) for lat, lon, ele in result["route"]],
-        "distance_m": result["distance_m"],
-        "duration_s": result["duration_s"],
-        "elevation_gain_m": result["elevation_gain_m"],
-        "elevation_loss_m": result["elevation_loss_m"],
-        "gpx_file_url": result["gpx_file_url"],
-        "gmaps_url": result["gmaps_url"],
-        "network_type": result["network_type"],
-    }
+    # The generator already returns (lat, lon, ele) rows and the remaining
+    # fields exactly as the response model expects. Returning a Response
+    # directly skips pydantic re-walking every coordinate on the way out;
+    # response_model is kept for the schema.
+    return ORJSONResponse(result)
 
 
 @app.get("/health")
@@ -157,8 +242,9 @@ async def probe():
     async def wake_graphhopper():
         url = f"{GRAPHHOPPER_HOST}/health"
         try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                await client.get(url)
+            # Reuse the shared keep-alive client; no timeout since a cold
+            # GraphHopper can take a while to come up.
+            await graphhopper_api.get_client().get(url, timeout=None)
         except Exception:
             pass
 
@@ -168,17 +254,5 @@ async def probe():
 
 @app.get("/privacy-policy", response_class=HTMLResponse)
 async def privacy_policy():
-    with open(PRIVACY_POLICY_PATH, "r", encoding="utf-8") as f:
-        content = f.read()
-    return HTMLResponse(content=content)
-
-
-# --- Redirect everything else to privacy policy ---
-@app.middleware("http")
-async def redirect_to_privacy_policy(request: Request, call_next):
-    allowed_paths = ["/probe", "/health", "/generate-route", "/privacy-policy"]
-
-    if not (request.url.path.startswith("/gpx/") or request.url.path in allowed_paths):
-        return RedirectResponse(url="/privacy-policy")
-
-    return await call_next(request)
+    return HTMLResponse(content=PRIVACY_POLICY_HTML,
+                        headers={"Cache-Control": "public, max-age=86400"})
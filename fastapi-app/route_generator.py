@@ -1,13 +1,61 @@
+import asyncio
 import random
-import pandas as pd
+import numpy as np
+from scipy.spatial import cKDTree
 from typing import Tuple, Optional, Dict, Any, List
 
 from utils.graphhopper_api import fetch_graphhopper_spt, fetch_graphhopper_route
 from utils.gmaps_link import generate_gmaps_route_url
 from utils.gpx_utils import create_gpx_file
 
+# Two independent SPT queries rarely report bit-identical coordinates for the
+# same road node, so ring intersection is done with a KDTree within a small
+# tolerance rather than an exact-equality merge.
+RING_MATCH_TOLERANCE_M = 5.0
+_METERS_PER_DEG_LAT = 111_320.0
 
-def generate_loop_route_from_single_waypoint(
+# SPT data is a dict of equal-length float64 arrays keyed by
+# 'longitude'/'latitude'/'distance' (see fetch_graphhopper_spt).
+SptColumns = Dict[str, np.ndarray]
+
+
+def _spt_size(spt: SptColumns) -> int:
+    return spt["distance"].size
+
+
+def _ring_filter(spt: SptColumns, lo: float, hi: float) -> SptColumns:
+    """Select SPT points whose network distance lies in [lo, hi] — one
+    vectorised mask pass instead of chained pandas comparisons."""
+    dist = spt["distance"]
+    idx = np.nonzero((dist >= lo) & (dist <= hi))[0]
+    return {name: col[idx] for name, col in spt.items()}
+
+
+def _sample_ring_point(ring: SptColumns) -> Tuple[float, float]:
+    """Pick one (lat, lon) from a ring uniformly at random."""
+    i = random.randrange(_spt_size(ring))
+    return float(ring["latitude"][i]), float(ring["longitude"][i])
+
+
+def _match_ring_points(ring1: SptColumns, ring2: SptColumns,
+                       tol_m: float = RING_MATCH_TOLERANCE_M) -> SptColumns:
+    """Return the points of ring1 that lie within tol_m metres of any ring2 point."""
+    if _spt_size(ring1) == 0 or _spt_size(ring2) == 0:
+        return {name: col[:0] for name, col in ring1.items()}
+
+    # Scale longitude by cos(latitude) so Euclidean degree distances are
+    # roughly isotropic, then query with a metre-derived tolerance.
+    scale = np.cos(np.deg2rad(float(ring2["latitude"].mean())))
+    pts2 = np.column_stack([ring2["latitude"], ring2["longitude"] * scale])
+    pts1 = np.column_stack([ring1["latitude"], ring1["longitude"] * scale])
+    tol_deg = tol_m / _METERS_PER_DEG_LAT
+
+    dist, _ = cKDTree(pts2).query(pts1, distance_upper_bound=tol_deg)
+    idx = np.nonzero(np.isfinite(dist))[0]
+    return {name: col[idx] for name, col in ring1.items()}
+
+
+async def generate_loop_route_from_single_waypoint(
     waypoint: Tuple[float, float],
     profile: str,
     target_distance_m: float,
@@ -21,44 +69,40 @@ def generate_loop_route_from_single_waypoint(
     print(f"\n[Loop Route] Generating looped route for '{profile}' | "
           f"Target={target_distance_m:.0f} m | Stage={stage_distance:.0f} m")
 
-    df1 = fetch_graphhopper_spt(profile, start_lat, start_lon,
-                                distance_limit=int(stage_distance + threshold),
-                                host=host)
-    if df1.empty:
+    spt1 = await fetch_graphhopper_spt(profile, start_lat, start_lon,
+                                       distance_limit=int(stage_distance + threshold),
+                                       host=host)
+    if _spt_size(spt1) == 0:
         print("No SPT data from start point.")
         return None
 
-    df1_ring = df1[(df1["distance"] >= stage_distance - threshold) &
-                   (df1["distance"] <= stage_distance + threshold)]
-    if df1_ring.empty:
+    ring1 = _ring_filter(spt1, stage_distance - threshold, stage_distance + threshold)
+    if _spt_size(ring1) == 0:
         print("No ring points found at target distance from start.")
         return None
 
-    first_random_point = df1_ring.sample(1).iloc[0]
-    p1_lat, p1_lon = first_random_point["latitude"], first_random_point["longitude"]
+    p1_lat, p1_lon = _sample_ring_point(ring1)
     print(f"Selected first intermediate point near ({p1_lat:.5f}, {p1_lon:.5f})")
 
-    df2 = fetch_graphhopper_spt(profile, p1_lat, p1_lon,
-                                distance_limit=int(stage_distance + threshold),
-                                host=host)
-    if df2.empty:
+    spt2 = await fetch_graphhopper_spt(profile, p1_lat, p1_lon,
+                                       distance_limit=int(stage_distance + threshold),
+                                       host=host)
+    if _spt_size(spt2) == 0:
         print("No SPT data from intermediate point.")
         return None
 
-    df2_ring = df2[(df2["distance"] >= stage_distance - threshold) &
-                   (df2["distance"] <= stage_distance + threshold)]
-    if df2_ring.empty:
+    ring2 = _ring_filter(spt2, stage_distance - threshold, stage_distance + threshold)
+    if _spt_size(ring2) == 0:
         print("No ring points found at target distance from intermediate point.")
         return None
 
-    print("Finding intersection of SPT rings (exact coordinate match)...")
-    common_points = pd.merge(df1_ring, df2_ring, on=["longitude", "latitude"])
-    if common_points.empty:
+    print("Finding intersection of SPT rings (within tolerance)...")
+    common_points = _match_ring_points(ring1, ring2)
+    if _spt_size(common_points) == 0:
         print("No common coordinates found between SPT rings.")
         return None
 
-    chosen_match = common_points.sample(1).iloc[0]
-    p2_lat, p2_lon = chosen_match["latitude"], chosen_match["longitude"]
+    p2_lat, p2_lon = _sample_ring_point(common_points)
     print(f"Selected intersection point at ({p2_lat:.5f}, {p2_lon:.5f})")
 
     points = [
@@ -68,7 +112,7 @@ def generate_loop_route_from_single_waypoint(
         (start_lat, start_lon)
     ]
 
-    route_data = fetch_graphhopper_route(profile, points=points, host=host)
+    route_data = await fetch_graphhopper_route(profile, points=points, host=host)
     if not route_data:
         print("Failed to generate route from selected points.")
         return None
@@ -77,14 +121,14 @@ def generate_loop_route_from_single_waypoint(
     duration_s = route_data["time"] / 1000
     elevation_gain = route_data["ascend"]
     elevation_loss = route_data["descend"]
-    coordinates = route_data["coordinates"]
 
-    route_coords_latlon = [(lat, lon, ele) for lon, lat, ele in coordinates]
+    # GraphHopper returns [lon, lat, ele]; swap columns in one C-level pass.
+    route_coords_latlon = np.asarray(route_data["coordinates"], dtype=np.float64)[:, [1, 0, 2]]
     gpx_file_url = create_gpx_file(route_coords_latlon)
     gmaps_url = generate_gmaps_route_url(points, profile=profile)
 
     return {
-        "route": coordinates,
+        "route": route_coords_latlon.tolist(),
         "distance_m": distance_m,
         "duration_s": duration_s,
         "elevation_gain_m": elevation_gain,
@@ -95,7 +139,7 @@ def generate_loop_route_from_single_waypoint(
     }
 
 
-def generate_GH_loop_route_from_single_waypoint(
+async def generate_GH_loop_route_from_single_waypoint(
     waypoint: Tuple[float, float],
     profile: str,
     target_distance_m: float,
@@ -103,7 +147,7 @@ def generate_GH_loop_route_from_single_waypoint(
 ) -> Optional[Dict[str, Any]]:
     """(Same as before – unchanged)"""
 
-    route_data = fetch_graphhopper_route(profile,
+    route_data = await fetch_graphhopper_route(profile,
                                          points=[waypoint],
                                          host=host, round_trip=True,
                                          round_trip_dist=target_distance_m)
@@ -115,18 +159,14 @@ def generate_GH_loop_route_from_single_waypoint(
     duration_s = route_data["time"] / 1000
     elevation_gain = route_data["ascend"]
     elevation_loss = route_data["descend"]
-    coordinates = route_data["coordinates"]
 
-    route_coords_latlon = [(lat, lon, ele) for lon, lat, ele in coordinates]
+    # GraphHopper returns [lon, lat, ele]; swap columns in one C-level pass.
+    route_coords_latlon = np.asarray(route_data["coordinates"], dtype=np.float64)[:, [1, 0, 2]]
 
-    # Sample up to 8 points evenly
+    # Sample up to 8 points evenly along the track
     num_samples = min(8, len(route_coords_latlon))
-    if num_samples == len(route_coords_latlon):
-        sampled_points = [(lat, lon) for lat, lon, _ in route_coords_latlon]
-    else:
-        # Compute evenly spaced indices
-        indices = [round(i * (len(route_coords_latlon) - 1) / (num_samples - 1)) for i in range(num_samples)]
-        sampled_points = [(route_coords_latlon[i][0], route_coords_latlon[i][1]) for i in indices]
+    indices = np.linspace(0, len(route_coords_latlon) - 1, num=num_samples, dtype=int)
+    sampled_points = [tuple(p) for p in route_coords_latlon[indices, :2].tolist()]
 
     # Insert into points array
     points = [
@@ -139,7 +179,7 @@ def generate_GH_loop_route_from_single_waypoint(
     gmaps_url = generate_gmaps_route_url(points, profile=profile)
 
     return {
-        "route": coordinates,
+        "route": route_coords_latlon.tolist(),
         "distance_m": distance_m,
         "duration_s": duration_s,
         "elevation_gain_m": elevation_gain,
@@ -150,7 +190,7 @@ def generate_GH_loop_route_from_single_waypoint(
     }
 
 
-def generate_multi_waypoint_route(
+async def generate_multi_waypoint_route(
     waypoints: List[Tuple[float, float]],
     profile: str,
     target_distance_m: float,
@@ -167,13 +207,17 @@ def generate_multi_waypoint_route(
         waypoints = waypoints + [waypoints[0]]
 
     # --- Compute base stage routes between consecutive waypoints ---
+    # The stages are independent, so fetch them all concurrently.
+    stage_routes = await asyncio.gather(*[
+        fetch_graphhopper_route(profile, points=[waypoints[i], waypoints[i + 1]], host=host)
+        for i in range(len(waypoints) - 1)
+    ])
+
     stage_results = []
     total_distance = 0.0
 
-    for i in range(len(waypoints) - 1):
+    for i, route in enumerate(stage_routes):
         w1, w2 = waypoints[i], waypoints[i + 1]
-
-        route = fetch_graphhopper_route(profile, points=[w1, w2], host=host)
         if not route:
             print(f"Failed to compute base route between {w1} and {w2}")
             return None
@@ -189,12 +233,12 @@ def generate_multi_waypoint_route(
     # --- Compare with target distance ---
     if total_distance >= target_distance_m:
         full_coords = [coord for s in stage_results for coord in s["route"]["coordinates"]]
-        route_coords_latlon = [(lat, lon, ele) for lon, lat, ele in full_coords]
+        route_coords_latlon = np.asarray(full_coords, dtype=np.float64)[:, [1, 0, 2]]
         gpx_file_url = create_gpx_file(route_coords_latlon)
         gmaps_url = generate_gmaps_route_url(waypoints, profile=profile)
 
         return {
-            "route": full_coords,
+            "route": route_coords_latlon.tolist(),
             "distance_m": total_distance,
             "duration_s": sum(s["route"]["time"] for s in stage_results) / 1000,
             "elevation_gain_m": sum(s["route"]["ascend"] for s in stage_results),
@@ -208,53 +252,51 @@ def generate_multi_waypoint_route(
     multiplier = target_distance_m / total_distance
 
     # --- For each stage, find SPT-based intermediate point ---
+    # All SPTs are independent of each other, so fetch the whole batch at once.
+    half_stages = [stage_results[i]["distance"] * multiplier / 2
+                   for i in range(len(waypoints) - 1)]
+    spts = await asyncio.gather(*[
+        fetch_graphhopper_spt(profile, lat, lon,
+                              distance_limit=int(half_stages[i] + threshold),
+                              host=host)
+        for i in range(len(waypoints) - 1)
+        for lat, lon in (waypoints[i], waypoints[i + 1])
+    ])
+
     new_points = [waypoints[0]]
 
     for i in range(len(waypoints) - 1):
-        w1_lat, w1_lon = waypoints[i]
-        w2_lat, w2_lon = waypoints[i + 1]
-        stage_target = stage_results[i]["distance"] * multiplier
-        half_stage = stage_target / 2
-
-        df1 = fetch_graphhopper_spt(profile, w1_lat, w1_lon,
-                                    distance_limit=int(half_stage + threshold),
-                                    host=host)
-        df2 = fetch_graphhopper_spt(profile, w2_lat, w2_lon,
-                                    distance_limit=int(half_stage + threshold),
-                                    host=host)
-        if df1.empty or df2.empty:
+        half_stage = half_stages[i]
+        spt1, spt2 = spts[2 * i], spts[2 * i + 1]
+        if _spt_size(spt1) == 0 or _spt_size(spt2) == 0:
             print("One of the SPTs is empty, skipping stage.")
             continue
 
-        df1_ring = df1[(df1["distance"] >= half_stage - threshold) &
-                       (df1["distance"] <= half_stage + threshold)]
-        df2_ring = df2[(df2["distance"] >= half_stage - threshold) &
-                       (df2["distance"] <= half_stage + threshold)]
+        ring1 = _ring_filter(spt1, half_stage - threshold, half_stage + threshold)
+        ring2 = _ring_filter(spt2, half_stage - threshold, half_stage + threshold)
 
-        common = pd.merge(df1_ring, df2_ring, on=["longitude", "latitude"])
-        if common.empty:
+        common = _match_ring_points(ring1, ring2)
+        if _spt_size(common) == 0:
             print("No intersection found, skipping intermediate point.")
             continue
 
-        chosen = common.sample(1).iloc[0]
-        lat_i, lon_i = chosen["latitude"], chosen["longitude"]
+        lat_i, lon_i = _sample_ring_point(common)
         new_points.append((lat_i, lon_i))
 
         new_points.append(waypoints[i + 1])
 
     # --- Generate final route through all points ---
-    route_data = fetch_graphhopper_route(profile, points=new_points, host=host)
+    route_data = await fetch_graphhopper_route(profile, points=new_points, host=host)
     if not route_data:
         print("Failed to generate final multi-waypoint route.")
         return None
 
-    coords = route_data["coordinates"]
-    route_coords_latlon = [(lat, lon, ele) for lon, lat, ele in coords]
+    route_coords_latlon = np.asarray(route_data["coordinates"], dtype=np.float64)[:, [1, 0, 2]]
     gpx_file_url = create_gpx_file(route_coords_latlon)
     gmaps_url = generate_gmaps_route_url(new_points, profile=profile)
 
     return {
-        "route": coords,
+        "route": route_coords_latlon.tolist(),
         "distance_m": route_data["distance"],
         "duration_s": route_data["time"] / 1000,
         "elevation_gain_m": route_data["ascend"],
@@ -265,7 +307,7 @@ def generate_multi_waypoint_route(
     }
 
 
-def generate_custom_route(
+async def generate_custom_route(
     waypoints: List[Tuple[float, float]],
     profile: str,
     target_distance_m: float,
@@ -277,10 +319,10 @@ def generate_custom_route(
         raise ValueError("At least one waypoint is required.")
 
     if len(waypoints) == 1:
-        return generate_GH_loop_route_from_single_waypoint(waypoint=waypoints[0], profile=profile,
+        return await generate_GH_loop_route_from_single_waypoint(waypoint=waypoints[0], profile=profile,
                                                            target_distance_m=target_distance_m, host=host)
     else:
-        return generate_multi_waypoint_route(
+        return await generate_multi_waypoint_route(
             waypoints=waypoints,
             profile=profile,
             target_distance_m=target_distance_m,
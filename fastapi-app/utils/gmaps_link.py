@@ -16,18 +16,24 @@ def generate_gmaps_route_url(
 
     gmaps_mode = graphhopper_to_gmaps[profile]
 
-    o_lat, o_lon = user_waypoints.pop(0)
-    d_lat, d_lon = user_waypoints.pop(-1)
-
-    # Format for Google Maps
-    url = f"https://www.google.com/maps/dir/?api=1&origin={o_lat},{o_lon}&destination={d_lat},{d_lon}"
-
-    waypoints_param = "|".join(f"{lat},{lon}" for lat, lon in user_waypoints)
-
+    # Index instead of pop: pop(0) shifts the whole list and silently
+    # mutates the caller's waypoints.
+    o_lat, o_lon = user_waypoints[0]
+    d_lat, d_lon = user_waypoints[-1]
+
+    # Fixed six-decimal coordinates (~10 cm) keep the URL short and skip the
+    # generic float repr; the parts are joined once at the end instead of
+    # growing the string piecewise.
+    parts = [
+        "https://www.google.com/maps/dir/?api=1"
+        f"&origin={o_lat:.6f},{o_lon:.6f}&destination={d_lat:.6f},{d_lon:.6f}"
+    ]
+
+    waypoints_param = "|".join(f"{lat:.6f},{lon:.6f}" for lat, lon in user_waypoints[1:-1])
     if waypoints_param:
-        url += f"&waypoints={waypoints_param}"
-    url += f"&travelmode={gmaps_mode}&dir_action=navigate"
+        parts.append(f"&waypoints={waypoints_param}")
+    parts.append(f"&travelmode={gmaps_mode}&dir_action=navigate")
     if gmaps_mode != "driving":
-        url += "&avoid=highways"
+        parts.append("&avoid=highways")
 
-    return url
+    return "".join(parts)
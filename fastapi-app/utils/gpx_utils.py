@@ -1,39 +1,42 @@
 import os
 import uuid
 from typing import List, Tuple
-import gpxpy
-import gpxpy.gpx
+
+_GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1" creator="RouteLooper">\n'
+    '  <trk>\n'
+    '    <trkseg>\n'
+)
+_GPX_FOOTER = (
+    '    </trkseg>\n'
+    '  </trk>\n'
+    '</gpx>\n'
+)
 
 
 def create_gpx_file(route_coords: List[Tuple[float, float, float]], output_dir: str = "gpx") -> str:
     """
-    Create a GPX file from a list of (lat, lon) tuples and return its file path.
+    Create a GPX file from (lat, lon, ele) rows — a list of tuples or an
+    (N, 3) ndarray — and return its file path.
+
+    Trackpoints are streamed through the buffered handle as they are
+    formatted, so the full document is never held in memory.
     """
 
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
 
-    # Create GPX structure
-    gpx = gpxpy.gpx.GPX()
-    gpx_track = gpxpy.gpx.GPXTrack()
-    gpx.tracks.append(gpx_track)
-    gpx_segment = gpxpy.gpx.GPXTrackSegment()
-    gpx_track.segments.append(gpx_segment)
-
-    # Add route and elevation points
-    for i, (lat, lon, ele) in enumerate(route_coords):
-        gpx_segment.points.append(gpxpy.gpx.GPXTrackPoint(lat, lon, elevation=ele))
-
     # Generate unique filename
     filename = f"route_{uuid.uuid4().hex[:8]}.gpx"
     filepath = os.path.join(output_dir, filename)
 
-    # Write GPX file
-    try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            xml_data = gpx.to_xml()
-            f.write(xml_data)
-    except Exception as e:
-        raise
+    with open(filepath, "w", encoding="utf-8", buffering=1 << 16) as f:
+        f.write(_GPX_HEADER)
+        f.writelines(
+            f'      <trkpt lat="{lat:.7f}" lon="{lon:.7f}"><ele>{ele:.2f}</ele></trkpt>\n'
+            for lat, lon, ele in route_coords
+        )
+        f.write(_GPX_FOOTER)
 
     return filepath
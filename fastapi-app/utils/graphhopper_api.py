@@ -1,17 +1,75 @@
-import requests
+import httpx
 import random
+import time
+import numpy as np
 import pandas as pd
 import io
 
+# One shared client so concurrent GraphHopper calls reuse keep-alive connections
+# instead of paying a TCP handshake per request.
+_client = httpx.AsyncClient(timeout=20,
+                            limits=httpx.Limits(max_keepalive_connections=20))
 
-def fetch_graphhopper_spt(profile: str, lat: float, lon: float, distance_limit: int = 30000,
-                          host: str = "http://localhost:8989") -> pd.DataFrame:
+
+def get_client() -> httpx.AsyncClient:
+    """The shared AsyncClient, for callers outside this module (e.g. /probe)."""
+    return _client
+
+
+async def aclose_client():
+    """Close the shared client; called from the app's shutdown hook."""
+    await _client.aclose()
+
+# TTL caches for repeated backend queries: the same start points and waypoint
+# pairs recur across requests, so identical queries skip GraphHopper entirely.
+# Coordinates are snapped to 5 decimal places (~1 m) when building keys.
+_CACHE_TTL = 3600
+_CACHE_MAX = 4096
+_spt_cache: dict[tuple, tuple[float, dict]] = {}
+_route_cache: dict[tuple, tuple[float, dict]] = {}
+
+_SPT_COLUMNS = ("longitude", "latitude", "distance")
+
+
+def _empty_spt() -> dict:
+    return {name: np.empty(0, dtype=np.float64) for name in _SPT_COLUMNS}
+
+
+def _cache_get(cache: dict, key: tuple):
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    expires, value = entry
+    if expires < time.monotonic():
+        del cache[key]
+        return None
+    return value
+
+
+def _cache_put(cache: dict, key: tuple, value):
+    if len(cache) >= _CACHE_MAX:
+        now = time.monotonic()
+        for stale in [k for k, (expires, _) in cache.items() if expires < now]:
+            del cache[stale]
+        while len(cache) >= _CACHE_MAX:
+            del cache[next(iter(cache))]  # oldest insertion
+    cache[key] = (time.monotonic() + _CACHE_TTL, value)
+
+
+async def fetch_graphhopper_spt(profile: str, lat: float, lon: float, distance_limit: int = 30000,
+                                host: str = "http://localhost:8989") -> dict:
     """
-    Fetches Shortest Path Tree (SPT) data from a local GraphHopper server and returns it as a pandas DataFrame.
+    Fetches Shortest Path Tree (SPT) data from a local GraphHopper server.
 
     Returns:
-        pd.DataFrame with columns: ['longitude', 'latitude', 'time', 'distance']
+        dict mapping 'longitude', 'latitude' and 'distance' to float64 ndarrays
+        of equal length (column/SoA layout; empty arrays on failure).
     """
+    cache_key = (profile, round(lat, 5), round(lon, 5), distance_limit, host)
+    cached = _cache_get(_spt_cache, cache_key)
+    if cached is not None:
+        return dict(cached)
+
     url = f"{host}/spt"
     params = {
         "profile": profile,
@@ -20,30 +78,39 @@ def fetch_graphhopper_spt(profile: str, lat: float, lon: float, distance_limit:
     }
 
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = await _client.get(url, params=params, timeout=10)
         response.raise_for_status()
 
-        text = response.text.strip()
-        if not text or not text.startswith("longitude,latitude"):
+        content = response.content
+        if not content.strip() or not content.lstrip().startswith(b"longitude,latitude"):
             print("Unexpected response format or empty result.")
-            return pd.DataFrame(columns=["longitude", "latitude", "time", "distance"])
-
-        # Parse CSV directly into DataFrame
-        df = pd.read_csv(io.StringIO(text))
-        df = df.dropna(subset=["longitude", "latitude"])  # Clean up partial rows if any
-        df[["longitude", "latitude"]] = df[["longitude", "latitude"]].astype(float)
-        return df.reset_index(drop=True)
-
-    except requests.RequestException as e:
+            return _empty_spt()
+
+        # Parse with the C engine and fixed dtypes: only these three columns
+        # are used downstream, and skipping type inference / NaN handling
+        # avoids the dropna + astype passes the generic parser needed.
+        df = pd.read_csv(io.BytesIO(content), usecols=_SPT_COLUMNS,
+                         dtype=np.float64, engine="c", na_filter=False)
+
+        # Hand columns out as plain arrays (SoA): ring filtering and the
+        # KDTree join in route_generator work on ndarrays directly. The
+        # cached arrays are frozen so hits can share them safely.
+        spt = {name: df[name].to_numpy() for name in _SPT_COLUMNS}
+        for arr in spt.values():
+            arr.setflags(write=False)
+        _cache_put(_spt_cache, cache_key, spt)
+        return dict(spt)
+
+    except httpx.HTTPError as e:
         print(f"Error connecting to GraphHopper server: {e}")
-        return pd.DataFrame(columns=["longitude", "latitude", "time", "distance"])
+        return _empty_spt()
 
 
-def fetch_graphhopper_route(profile: str,
-                            points: list,
-                            round_trip: bool = False,
-                            round_trip_dist: float | None = None,
-                            host: str = "http://localhost:8989") -> dict:
+async def fetch_graphhopper_route(profile: str,
+                                  points: list,
+                                  round_trip: bool = False,
+                                  round_trip_dist: float | None = None,
+                                  host: str = "http://localhost:8989") -> dict:
     """
     Fetches a route between multiple points from a local GraphHopper server for a specific transport mode.
 
@@ -62,11 +129,19 @@ def fetch_graphhopper_route(profile: str,
             - 'descend' (m)
             - 'bbox'
             - 'coordinates' (list of [lon, lat, elevation])
-            - 'df' (pandas.DataFrame with columns: ['longitude', 'latitude', 'elevation'])
     """
     if len(points) < 2 and not round_trip:
         raise ValueError("At least two points are required to fetch a route.")
 
+    # Round trips are seeded randomly so each call should produce a fresh
+    # loop — only fixed point-to-point routes are cacheable.
+    cache_key = None
+    if not round_trip:
+        cache_key = (profile, tuple((round(lat, 5), round(lon, 5)) for lat, lon in points), host)
+        cached = _cache_get(_route_cache, cache_key)
+        if cached is not None:
+            return dict(cached)
+
     url = f"{host}/route"
 
     # Build params dynamically for multiple waypoints
@@ -79,7 +154,7 @@ def fetch_graphhopper_route(profile: str,
         rt_params = {
             "algorithm": "round_trip",
             "round_trip.distance": round_trip_dist,
-            "round_trip.seed": random.randint(-(2 ** 63), 2 ** 63 - 1),  # random int64 seed each time for round trip
+            "round_trip.seed": random.getrandbits(64) - (1 << 63),  # random int64 seed each time for round trip
         }
 
         params.extend(rt_params.items())
@@ -90,7 +165,7 @@ def fetch_graphhopper_route(profile: str,
         params.append(("point", f"{lat},{lon}"))
 
     try:
-        response = requests.get(url, params=params, timeout=20)
+        response = await _client.get(url, params=params, timeout=20)
         response.raise_for_status()
 
         data = response.json()
@@ -102,9 +177,6 @@ def fetch_graphhopper_route(profile: str,
         path = data["paths"][0]
         coords = path["points"]["coordinates"]
 
-        # Convert to DataFrame
-        df = pd.DataFrame(coords, columns=["longitude", "latitude", "elevation"])
-
         print(
             f"[{profile}] Route fetched | Distance: {path['distance']:.1f} m | "
             f"Time: {path['time']/1000:.1f} s | "
@@ -112,33 +184,39 @@ def fetch_graphhopper_route(profile: str,
             f"Waypoints: {len(points)}"
         )
 
-        return {
+        result = {
             "distance": path["distance"],
             "time": path["time"],
             "ascend": path["ascend"],
             "descend": path["descend"],
             "bbox": path.get("bbox"),
             "coordinates": coords,
-            "df": df
         }
+        if cache_key is not None:
+            _cache_put(_route_cache, cache_key, result)
+        return result
 
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"[{profile}] Error connecting to GraphHopper server: {e}")
         return {}
 
 
 if __name__ == "__main__":
-    # Example usage
-    print("Fetching SPT...")
-    df_spt = fetch_graphhopper_spt("car", 51.8940, -2.0786, distance_limit=5000)
-    print(f"SPT received {len(df_spt)} rows.\n")
-
-    print("Fetching route with waypoints...")
-    route = fetch_graphhopper_route("car", points=[
-        (51.882172, -1.999488),  # Start
-        (51.907393, -2.087897),  # Midpoint / waypoint
-        (51.896907, -2.115882)  # End
-    ])
-
-    if route:
-        print(f"\nFirst 5 route points:\n{route['df'].head()}")
\ No newline at end of file
+    import asyncio
+
+    async def _example():
+        print("Fetching SPT...")
+        spt = await fetch_graphhopper_spt("car", 51.8940, -2.0786, distance_limit=5000)
+        print(f"SPT received {len(spt['distance'])} rows.\n")
+
+        print("Fetching route with waypoints...")
+        route = await fetch_graphhopper_route("car", points=[
+            (51.882172, -1.999488),  # Start
+            (51.907393, -2.087897),  # Midpoint / waypoint
+            (51.896907, -2.115882)  # End
+        ])
+
+        if route:
+            print(f"\nFirst 5 route points:\n{route['coordinates'][:5]}")
+
+    asyncio.run(_example())
\ No newline at end of file